@@ -1,10 +1,11 @@
-import sys, random, json
+import sys, re, random, json, time, functools, heapq, bisect, zlib, threading
+from collections import deque
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QHBoxLayout, QVBoxLayout, QPushButton, QLabel, QListWidget,
-    QFileDialog, QComboBox, QSpinBox, QMessageBox, QCheckBox, QSlider
+    QFileDialog, QComboBox, QSpinBox, QMessageBox, QCheckBox, QSlider, QAbstractItemView
 )
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QColor, QPainter
+from PyQt5.QtCore import Qt, QTimer, QObject, pyqtSignal
+from PyQt5.QtGui import QColor, QPainter, QFont
 import mido
 
 SCALES = {
@@ -27,10 +28,72 @@ SCALE_NAMES = list(SCALES.keys())
 ROOT_NOTES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
 ROOT2MIDI = {note: midi for midi, note in enumerate(ROOT_NOTES)}
 PATTERN_LEN = 16
+ACCENT_VELOCITY = 110
+INPUT_MODES = ["Off", "Step", "Realtime"]
+AUTOMATION_CCS = {"Cutoff": 74, "Resonance": 71, "Decay": 75}
+LANE_CURVES = ["linear", "smooth", "step"]
+DIN_BYTES_PER_MS = 3.125  # 31.25 kbaud, 10 bits per byte on the wire
 
 def root_note_to_midi(root_note, octave=3):
     return ROOT2MIDI[root_note] + 12 * octave
 
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Profiler:
+    def __init__(self, window=256, max_events=100000):
+        self.enabled = False
+        self.window = window
+        self.samples = {}
+        self.events = deque(maxlen=max_events)
+        self.t0 = time.perf_counter()
+    def record(self, name, start, end):
+        d = self.samples.get(name)
+        if d is None:
+            d = self.samples[name] = deque(maxlen=self.window)
+        d.append((end - start) * 1000.0)
+        self.events.append((name, start, end))
+    def reset(self):
+        self.samples.clear()
+        self.events.clear()
+        self.t0 = time.perf_counter()
+    def stats(self):
+        out = []
+        for name, d in self.samples.items():
+            out.append((name, len(d), percentile(d, 0.5), percentile(d, 0.99)))
+        out.sort(key=lambda s: s[3], reverse=True)
+        return out
+    def summary(self, limit=4):
+        return "  ".join(f"{name} {p50:.2f}/{p99:.2f}ms" for name, n, p50, p99 in self.stats()[:limit])
+    def dump_trace(self, fname):
+        # Chrome trace event format (chrome://tracing, Perfetto, speedscope)
+        events = [{
+            "name": name, "ph": "X", "pid": 1, "tid": 1,
+            "ts": round((start - self.t0) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1)
+        } for name, start, end in self.events]
+        with open(fname, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+PROFILER = Profiler()
+
+def profiled(name):
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not PROFILER.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                PROFILER.record(name, start, time.perf_counter())
+        return inner
+    return wrap
+
 class PatternStep:
     def __init__(self, note_idx=None, accent=False, slide=False, velocity=80):
         self.note_idx = note_idx
@@ -43,8 +106,80 @@ class PatternStep:
     def from_dict(d):
         return PatternStep(d.get('note_idx',None), d.get('accent',False), d.get('slide',False), d.get('velocity',80))
 
+class AutomationLane:
+    def __init__(self, cc=74, values=None, curve="linear"):
+        self.cc = cc
+        self.curve = curve
+        self.values = values if values else [None] * PATTERN_LEN
+        self._cache = {}
+    def as_dict(self):
+        return {'cc': self.cc, 'curve': self.curve, 'values': list(self.values)}
+    @staticmethod
+    def from_dict(d):
+        values = list(d.get('values') or [])[:PATTERN_LEN]
+        values += [None] * (PATTERN_LEN - len(values))
+        return AutomationLane(d.get('cc', 74), values, d.get('curve', "linear"))
+    def set(self, step, value):
+        self.values[step] = value
+        self._cache.clear()
+    def set_curve(self, curve):
+        self.curve = curve
+        self._cache.clear()
+    def rotate(self, n):
+        self.values = self.values[n:] + self.values[:n]
+        self._cache.clear()
+    def render(self, resolution=1):
+        # one value per sub-step; interpolation wraps over the pattern end so loops stay seamless
+        out = self._cache.get(resolution)
+        if out is not None:
+            return out
+        points = [i for i, v in enumerate(self.values) if v is not None]
+        out = []
+        if points:
+            for t in range(PATTERN_LEN * resolution):
+                pos = t / resolution
+                prev = max((i for i in points if i <= pos), default=points[-1])
+                nxt = min((i for i in points if i > pos), default=points[0])
+                a, b = self.values[prev], self.values[nxt]
+                span = (nxt - prev) % PATTERN_LEN or PATTERN_LEN
+                f = ((pos - prev) % PATTERN_LEN) / span
+                if self.curve == "step":
+                    f = 0.0
+                elif self.curve == "smooth":
+                    f = f * f * (3 - 2 * f)
+                out.append(int(round(a + (b - a) * f)))
+        self._cache[resolution] = out
+        return out
+
+class CCThinner:
+    # Drops repeated and sub-threshold CC values and keeps each tick within a share
+    # of the DIN MIDI bandwidth, so dense sweeps never crowd out note messages.
+    def __init__(self, min_delta=2, share=0.5):
+        self.min_delta = min_delta
+        self.share = share
+        self.last = {}
+    def reset(self):
+        self.last.clear()
+    def select(self, channel, values, tick_ms):
+        budget = max(1, int(tick_ms * DIN_BYTES_PER_MS * self.share / 3))
+        pending = []
+        for cc, v, key in values:
+            prev = self.last.get((channel, cc))
+            if prev == v:
+                continue
+            delta = 128 if prev is None else abs(v - prev)
+            if delta < self.min_delta and not key:
+                continue
+            pending.append((key, delta, cc, v))
+        if len(pending) > budget:
+            pending.sort(reverse=True)
+            del pending[budget:]
+        for _, _, cc, v in pending:
+            self.last[(channel, cc)] = v
+        return [(cc, v) for _, _, cc, v in pending]
+
 class Pattern:
-    def __init__(self, name="Pattern", scale="acid", root="C", octave=3, steps=None, transpose=0, swing=50):
+    def __init__(self, name="Pattern", scale="acid", root="C", octave=3, steps=None, transpose=0, swing=50, lanes=None):
         self.name = name
         self.scale = scale
         self.root = root
@@ -55,6 +190,7 @@ class Pattern:
             self.steps = steps
         else:
             self.steps = [PatternStep() for _ in range(PATTERN_LEN)]
+        self.lanes = lanes if lanes else []
     def as_dict(self):
         return {
             'name': self.name,
@@ -63,7 +199,8 @@ class Pattern:
             'octave': self.octave,
             'transpose': self.transpose,
             'swing': self.swing,
-            'steps': [s.as_dict() for s in self.steps]
+            'steps': [s.as_dict() for s in self.steps],
+            'lanes': [l.as_dict() for l in self.lanes]
         }
     @staticmethod
     def from_dict(d):
@@ -74,7 +211,8 @@ class Pattern:
             octave=d.get('octave',3),
             transpose=d.get('transpose',0),
             swing=d.get('swing',50),
-            steps=[PatternStep.from_dict(s) for s in d['steps']]
+            steps=[PatternStep.from_dict(s) for s in d['steps']],
+            lanes=[AutomationLane.from_dict(l) for l in d.get('lanes', [])]
         )
     def randomize(self, wide=None, vel_min=80, vel_max=120, rand_accent=False, rand_slide=False,
                   rand_swing=False, swing_value=50, density=12, rand_density=False, rand_velocity=False, rand_notes=True):
@@ -116,10 +254,684 @@ class Pattern:
             else:
                 out.append(None)
         return out
+    def note_idx_for(self, pitch):
+        # nearest scale degree, folded into the grid's single octave
+        intervals = SCALES.get(self.scale, SCALES["acid"])
+        rel = (pitch - root_note_to_midi(self.root, self.octave) - self.transpose) % 12
+        return min(range(len(intervals)), key=lambda i: min(abs(intervals[i] - rel), 12 - abs(intervals[i] - rel)))
     def shift_left(self):
         self.steps = self.steps[1:] + self.steps[:1]
+        for l in self.lanes: l.rotate(1)
     def shift_right(self):
         self.steps = self.steps[-1:] + self.steps[:-1]
+        for l in self.lanes: l.rotate(-1)
+    def lane(self, cc, create=False):
+        for l in self.lanes:
+            if l.cc == cc:
+                return l
+        if create:
+            l = AutomationLane(cc)
+            self.lanes.append(l)
+            return l
+        return None
+
+MUTATION_WEIGHTS = {"nudge": 4, "swap": 2, "rest": 2, "accent": 1, "slide": 1, "velocity": 3, "rotate": 1}
+
+class PatternPopulation:
+    # Struct-of-arrays over many patterns: step i of individual k is at k * PATTERN_LEN + i,
+    # rests are note -1. Operators run over the whole population in one pass.
+    # rotations[k] is how far individual k was rotated, so its lanes can follow.
+    def __init__(self, notes, accents, slides, velocities, nrows, rotations=None):
+        self.notes = notes
+        self.accents = accents
+        self.slides = slides
+        self.velocities = velocities
+        self.nrows = nrows
+        self.rotations = rotations if rotations is not None else [0] * (len(notes) // PATTERN_LEN)
+
+    @property
+    def size(self):
+        return len(self.notes) // PATTERN_LEN
+
+    @staticmethod
+    def from_patterns(patterns, size=None):
+        # note indices only mean the same thing within one scale
+        if len({p.scale for p in patterns}) > 1:
+            raise ValueError("All patterns in a population must use the same scale")
+        size = size or len(patterns)
+        pop = PatternPopulation([], [], [], [], len(SCALES.get(patterns[0].scale, SCALES["acid"])))
+        for k in range(size):
+            for s in patterns[k % len(patterns)].steps:
+                pop.notes.append(-1 if s.note_idx is None else s.note_idx)
+                pop.accents.append(bool(s.accent))
+                pop.slides.append(bool(s.slide))
+                pop.velocities.append(s.velocity)
+            pop.rotations.append(0)
+        return pop
+
+    def to_pattern(self, k, template, name=None):
+        a = k * PATTERN_LEN
+        steps = [PatternStep(None if self.notes[i] < 0 else self.notes[i], self.accents[i], self.slides[i], self.velocities[i])
+                 for i in range(a, a + PATTERN_LEN)]
+        lanes = [AutomationLane.from_dict(l.as_dict()) for l in template.lanes]
+        for l in lanes:
+            l.rotate(self.rotations[k])
+        return Pattern(name=name or template.name, scale=template.scale, root=template.root, octave=template.octave,
+                       steps=steps, transpose=template.transpose, swing=template.swing, lanes=lanes)
+
+    def individual(self, k):
+        a = k * PATTERN_LEN
+        b = a + PATTERN_LEN
+        return self.notes[a:b], self.accents[a:b], self.slides[a:b], self.velocities[a:b]
+
+    def select(self, indices):
+        out = PatternPopulation([], [], [], [], self.nrows)
+        for k in indices:
+            a = k * PATTERN_LEN
+            b = a + PATTERN_LEN
+            out.notes += self.notes[a:b]
+            out.accents += self.accents[a:b]
+            out.slides += self.slides[a:b]
+            out.velocities += self.velocities[a:b]
+            out.rotations.append(self.rotations[k])
+        return out
+
+    def extend(self, other):
+        self.notes += other.notes
+        self.accents += other.accents
+        self.slides += other.slides
+        self.velocities += other.velocities
+        self.rotations += other.rotations
+
+    def mutate(self, rate=0.1, weights=None, rng=random):
+        weights = weights or MUTATION_WEIGHTS
+        total = len(self.notes)
+        count = int(round(total * rate))
+        if not count: return self
+        names = list(weights)
+        ops = rng.choices(names, weights=[weights[n] for n in names], k=count)
+        positions = rng.choices(range(total), k=count)
+        notes, vels, top = self.notes, self.velocities, self.nrows - 1
+        for op, i in zip(ops, positions):
+            if op == "nudge":
+                if notes[i] >= 0:
+                    notes[i] = max(0, min(top, notes[i] + rng.choice((-1, 1))))
+            elif op == "swap":
+                j = i - i % PATTERN_LEN + rng.randrange(PATTERN_LEN)
+                for arr in (notes, self.accents, self.slides, vels):
+                    arr[i], arr[j] = arr[j], arr[i]
+            elif op == "rest":
+                notes[i] = rng.randint(0, top) if notes[i] < 0 else -1
+            elif op == "accent":
+                self.accents[i] = not self.accents[i]
+            elif op == "slide":
+                self.slides[i] = not self.slides[i]
+            elif op == "velocity":
+                vels[i] = max(1, min(127, vels[i] + rng.randint(-12, 12)))
+            elif op == "rotate":
+                a = i - i % PATTERN_LEN
+                b = a + PATTERN_LEN
+                n = rng.choice((-1, 1))
+                for arr in (notes, self.accents, self.slides, vels):
+                    arr[a:b] = arr[a+n:b] + arr[a:a+n] if n > 0 else arr[b+n:b] + arr[a:b+n]
+                k = i // PATTERN_LEN
+                self.rotations[k] = (self.rotations[k] + n) % PATTERN_LEN
+        return self
+
+    def crossover(self, pairs, rng=random):
+        # one-point crossover, one child per (a, b) pair of individual indices;
+        # the child keeps the first parent's lane rotation
+        out = PatternPopulation([], [], [], [], self.nrows)
+        for a, b in pairs:
+            out.rotations.append(self.rotations[a])
+            cut = rng.randrange(1, PATTERN_LEN)
+            a *= PATTERN_LEN
+            b *= PATTERN_LEN
+            out.notes += self.notes[a:a+cut] + self.notes[b+cut:b+PATTERN_LEN]
+            out.accents += self.accents[a:a+cut] + self.accents[b+cut:b+PATTERN_LEN]
+            out.slides += self.slides[a:a+cut] + self.slides[b+cut:b+PATTERN_LEN]
+            out.velocities += self.velocities[a:a+cut] + self.velocities[b+cut:b+PATTERN_LEN]
+        return out
+
+def evolve(patterns, fitness, generations=20, size=1000, elite=0.05, rate=0.08,
+           crossover=0.5, weights=None, rng=None):
+    # fitness(population) -> list of scores, higher is better. Returns the final
+    # population sorted best first and its scores.
+    rng = rng or random
+    pop = PatternPopulation.from_patterns(patterns, size).mutate(rate, weights, rng)
+    n_elite = max(1, int(size * elite))
+    for _ in range(generations):
+        scores = fitness(pop)
+        order = sorted(range(pop.size), key=scores.__getitem__, reverse=True)
+        parents = order[:max(2, size // 2)]
+        n_children = size - n_elite
+        n_cross = int(n_children * crossover)
+        children = pop.crossover([(rng.choice(parents), rng.choice(parents)) for _ in range(n_cross)], rng)
+        children.extend(pop.select(rng.choices(parents, k=n_children - n_cross)))
+        children.mutate(rate, weights, rng)
+        pop = pop.select(order[:n_elite])
+        pop.extend(children)
+    scores = fitness(pop)
+    order = sorted(range(pop.size), key=scores.__getitem__, reverse=True)
+    return pop.select(order), [scores[k] for k in order]
+
+def chain_entry_repeat(entry):
+    if isinstance(entry, dict):
+        return max(1, int(entry.get('repeat', 1)))
+    return 1
+
+def chain_entry_label(entry, patterns):
+    if isinstance(entry, dict):
+        if 'items' in entry:
+            inner = ", ".join(chain_entry_label(e, patterns) for e in entry['items'])
+            label = f"[{entry.get('name', 'Section')}: {inner}]"
+        else:
+            label = chain_entry_label(entry.get('pattern', 0), patterns)
+        repeat = chain_entry_repeat(entry)
+        return label + (f" ×{repeat}" if repeat > 1 else "")
+    if 0 <= entry < len(patterns):
+        return patterns[entry].name
+    return "X"
+
+class Arrangement:
+    # Chain entries are pattern indices, {"pattern": i, "repeat": n} or nested
+    # sections {"name": ..., "items": [...], "repeat": n}. They are compiled into a
+    # tree whose size follows the chain, not the number of bars: a node is a pattern
+    # index (any length), ('loop', period, node) or ('seq', starts, children).
+    # Seeking walks the tree with bisect, so it costs O(depth * log(entries)).
+    MAX_DEPTH = 16
+
+    def __init__(self, chain=None):
+        self.compile(chain or [])
+
+    def compile(self, chain):
+        nodes = [self._entry(entry, 0) for entry in chain]
+        self.entry_start = []
+        total = 0
+        for length, _ in nodes:
+            self.entry_start.append(total)
+            total += length
+        self.total, self.root = self._seq(nodes)
+        return self
+
+    @staticmethod
+    def _seq(nodes):
+        # adjacent runs of the same pattern merge into one leaf
+        merged = []
+        for length, node in nodes:
+            if not length:
+                continue
+            if merged and isinstance(node, int) and merged[-1][1] == node:
+                merged[-1][0] += length
+            else:
+                merged.append([length, node])
+        if not merged:
+            return 0, None
+        if len(merged) == 1:
+            return merged[0][0], merged[0][1]
+        starts = []
+        total = 0
+        for length, _ in merged:
+            starts.append(total)
+            total += length
+        return total, ('seq', starts, [node for _, node in merged])
+
+    def _entry(self, entry, depth):
+        if not isinstance(entry, dict):
+            return 1, int(entry)
+        repeat = chain_entry_repeat(entry)
+        if 'items' not in entry:
+            return repeat, int(entry.get('pattern', 0))
+        if depth >= self.MAX_DEPTH:
+            return 0, None
+        period, node = self._seq([self._entry(e, depth + 1) for e in entry['items']])
+        if not period or repeat == 1 or isinstance(node, int):
+            return period * repeat, node
+        return period * repeat, ('loop', period, node)
+
+    @property
+    def bars(self):
+        return self.total
+
+    def pattern_at(self, bar):
+        bar %= self.total
+        node = self.root
+        while not isinstance(node, int):
+            if node[0] == 'loop':
+                bar %= node[1]
+                node = node[2]
+            else:
+                i = bisect.bisect_right(node[1], bar) - 1
+                bar -= node[1][i]
+                node = node[2][i]
+        return node
+
+    def locate(self, step):
+        # absolute step -> (bar, step in bar, pattern index)
+        bar, step_idx = divmod(step, PATTERN_LEN)
+        bar %= self.total
+        return bar, step_idx, self.pattern_at(bar)
+
+    def runs(self):
+        # (pattern, bars) in playing order; lazily expands repeats
+        def walk(node, length):
+            if isinstance(node, int):
+                yield node, length
+            elif node[0] == 'loop':
+                for _ in range(length // node[1]):
+                    yield from walk(node[2], node[1])
+            else:
+                starts, children = node[1], node[2]
+                ends = starts[1:] + [length]
+                for start, end, child in zip(starts, ends, children):
+                    yield from walk(child, end - start)
+        if self.root is not None:
+            yield from walk(self.root, self.total)
+
+    def iter_bars(self):
+        for pat, count in self.runs():
+            for _ in range(count):
+                yield pat
+
+class VoiceTracker:
+    # Sounding notes per channel and a time-ordered note-off queue. A voice with
+    # off_time None is tied (slide) and is released by the next step.
+    def __init__(self):
+        self.voices = {}
+        self.queue = []
+
+    def sounding(self, channel):
+        return self.voices.get(channel, {})
+
+    def tied(self, channel):
+        return [n for n, off in self.voices.get(channel, {}).items() if off is None]
+
+    def start(self, channel, note, off_time=None):
+        self.voices.setdefault(channel, {})[note] = off_time
+        if off_time is not None:
+            heapq.heappush(self.queue, (off_time, channel, note))
+
+    def stop(self, channel, note):
+        chan = self.voices.get(channel)
+        if chan is not None:
+            chan.pop(note, None)
+
+    def due(self, now):
+        out = []
+        q = self.queue
+        while q and q[0][0] <= now:
+            off_time, channel, note = heapq.heappop(q)
+            chan = self.voices.get(channel)
+            # stale entries (note retriggered or tied since) are skipped
+            if chan is not None and chan.get(note) == off_time:
+                del chan[note]
+                out.append((channel, note))
+        return out
+
+    def next_due(self):
+        q = self.queue
+        while q:
+            off_time, channel, note = q[0]
+            if self.voices.get(channel, {}).get(note) == off_time:
+                return off_time
+            heapq.heappop(q)
+        return None
+
+    def release_all(self):
+        out = [(channel, note) for channel, chan in self.voices.items() for note in chan]
+        self.voices.clear()
+        self.queue.clear()
+        return out
+
+QUEUE_POLICIES = ["drop_oldest", "drop_newest", "block"]
+
+def is_note_off(msg):
+    return msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0)
+
+def drop_priority(msg):
+    # what a full queue gives up first: CCs and other non-note data, then note_ons;
+    # note_offs are never dropped so nothing is left hanging
+    if is_note_off(msg):
+        return None
+    return 1 if msg.type == 'note_on' else 0
+
+class PortSender(threading.Thread):
+    # Owns one output port; events are queued by the clock and sent from this thread,
+    # so a slow port only ever delays itself. channels=None sends messages unchanged.
+    def __init__(self, port_name, channels, policy="drop_oldest", maxsize=256, block_timeout=0.005, on_status=None,
+                 retry_interval=1.0):
+        super().__init__(daemon=True)
+        self.port_name = port_name
+        self.channels = channels
+        self.policy = policy
+        self.maxsize = maxsize
+        self.block_timeout = block_timeout
+        self.on_status = on_status
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.latency = deque(maxlen=512)
+        self.dropped = 0
+        self.error = None
+        self.port = None
+        self.lost = False
+        self.reopen_name = None
+        self.retry_interval = retry_interval
+        self.next_retry = 0.0
+
+    def set_error(self, error):
+        if error == self.error: return
+        self.error = error
+        if self.on_status:
+            self.on_status(self.port_name, error or "")
+
+    def open_port(self, name):
+        try:
+            self.port = mido.open_output(name)
+            self.port_name = name
+            self.set_error(None)
+        except (IOError, OSError) as e:
+            self.set_error(str(e))
+            self.next_retry = time.perf_counter() + self.retry_interval
+
+    def close_port(self):
+        if self.port is not None:
+            self.port.close()
+            self.port = None
+
+    def _make_room(self, msg):
+        # called with the queue full; returns False when the new message is the one to drop
+        new = drop_priority(msg)
+        victim = None
+        for i, (_, queued) in enumerate(self.items):
+            p = drop_priority(queued)
+            if p is not None and (victim is None or p < victim[1]):
+                victim = (i, p)
+                if p == 0 and self.policy == "drop_oldest":
+                    break
+        if new is not None and (victim is None or new < victim[1] or
+                                (new == victim[1] and self.policy != "drop_oldest")):
+            return False
+        if victim is not None:
+            del self.items[victim[0]]
+            self.dropped += 1
+        return True
+
+    def put(self, msg):
+        item = (time.perf_counter(), msg)
+        with self.cond:
+            if self.stopping:
+                return
+            if len(self.items) >= self.maxsize and self.policy == "block":
+                self.cond.wait_for(lambda: len(self.items) < self.maxsize or self.stopping, self.block_timeout)
+            if len(self.items) >= self.maxsize and not self._make_room(msg):
+                self.dropped += 1
+                return
+            self.items.append(item)
+            self.cond.notify_all()
+
+    def run(self):
+        self.open_port(self.port_name)
+        while True:
+            with self.cond:
+                if not self.items and not self.stopping:
+                    self.cond.wait(0.25)
+                item = self.items.popleft() if self.items else None
+                stopping = self.stopping
+                self.cond.notify_all()
+            # hot-plug: the scanner flags lost ports and asks for reopening when they return
+            if self.lost:
+                self.lost = False
+                self.close_port()
+            if self.reopen_name and self.port is None:
+                name, self.reopen_name = self.reopen_name, None
+                self.open_port(name)
+            elif self.port is None and not stopping and time.perf_counter() >= self.next_retry:
+                # after a failed open or a send error, keep retrying on our own
+                self.open_port(self.port_name)
+            if item is None:
+                if stopping:
+                    break
+                continue
+            if self.port is None:
+                # no port to send to (failed open or lost): the message is a drop
+                with self.cond:
+                    self.dropped += 1
+                continue
+            queued, msg = item
+            try:
+                if self.channels is not None and hasattr(msg, 'channel'):
+                    for ch in self.channels:
+                        self.port.send(msg if ch == msg.channel else msg.copy(channel=ch))
+                else:
+                    self.port.send(msg)
+            except (IOError, OSError) as e:
+                self.set_error(str(e))
+                self.close_port()
+                self.next_retry = time.perf_counter() + self.retry_interval
+                with self.cond:
+                    self.dropped += 1
+                continue
+            self.latency.append((time.perf_counter() - queued) * 1000.0)
+        self.close_port()
+
+    def stop(self):
+        # never blocks: what is already queued is still sent, then the thread exits
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+
+    def stats(self):
+        latency = list(self.latency)
+        return self.port_name, percentile(latency, 0.5), percentile(latency, 0.99), self.dropped, self.error
+
+class MidiFanout(QObject):
+    # Drop-in for a mido output port: send() fans out to every (port, channels) route.
+    # Open/send failures and recoveries are reported through port_status.
+    port_status = pyqtSignal(str, str)
+
+    def __init__(self, routes, policy="drop_oldest", maxsize=256):
+        super().__init__()
+        merged = {}
+        for name, channels in routes:
+            if channels is None or merged.get(name, []) is None:
+                merged[name] = None
+            else:
+                chans = merged.setdefault(name, [])
+                chans.extend(ch for ch in channels if ch not in chans)
+        self.senders = [PortSender(name, chans, policy, maxsize, on_status=self.report)
+                        for name, chans in merged.items()]
+
+    def report(self, name, error):
+        self.port_status.emit(name, error)
+
+    def start(self):
+        for sender in self.senders:
+            sender.start()
+
+    def send(self, msg):
+        for sender in self.senders:
+            sender.put(msg)
+
+    def close(self):
+        # sender threads drain and close their ports on their own; a stalled port
+        # must not hold up the caller, so there is no join here
+        for sender in self.senders:
+            sender.stop()
+
+    def stats(self):
+        return [sender.stats() for sender in self.senders]
+
+    def refresh(self, names):
+        keys = {port_key(n): n for n in names}
+        for sender in self.senders:
+            name = keys.get(port_key(sender.port_name))
+            if name is None:
+                sender.lost = True
+            elif sender.port is None or name != sender.port_name:
+                # replugged between two scans: same device under new ALSA numbers,
+                # so the old handle is dead even though the port never looked missing
+                sender.reopen_name = name
+                sender.lost = name != sender.port_name
+
+def port_key(name):
+    # ALSA appends "client:port" numbers which change when a device is replugged
+    return re.sub(r"\s+\d+:\d+$", "", name)
+
+class PortScanner(QObject):
+    # Enumerates MIDI ports off the GUI thread and reports only when the lists changed.
+    ports_changed = pyqtSignal(list, list)
+    def __init__(self):
+        super().__init__()
+        self.ports = None
+        self.busy = False
+    def scan(self):
+        if self.busy: return
+        self.busy = True
+        threading.Thread(target=self._scan, daemon=True).start()
+    def _scan(self):
+        try:
+            ports = (mido.get_output_names(), mido.get_input_names())
+        except (IOError, OSError, RuntimeError):
+            ports = None
+        finally:
+            self.busy = False
+        if ports is not None and ports != self.ports:
+            self.ports = ports
+            self.ports_changed.emit(list(ports[0]), list(ports[1]))
+
+class MidiInput(QObject):
+    # mido's rtmidi backend calls back on its own input thread; notes are
+    # timestamped there and handed to the GUI thread through a queued signal.
+    note = pyqtSignal(float, object)
+    def __init__(self, name):
+        super().__init__()
+        self.port = mido.open_input(name, callback=self._on_message)
+    def _on_message(self, msg):
+        if msg.type in ('note_on', 'note_off'):
+            self.note.emit(time.perf_counter(), msg)
+    def close(self):
+        self.port.close()
+
+SESSION_MAGIC = b"ACBS\x01"
+SESSION_MIDI = 1
+SESSION_MODEL = 2
+SESSION_ERRORS = (ValueError, IndexError, zlib.error)
+
+def _varint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+def _read_varint(data, pos):
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+class SessionRecorder:
+    # Binary log: magic, then records of kind byte + varint µs delta + payload.
+    # MIDI payload is the raw message (length in the kind's high nibble), model
+    # payload is a varint length + zlib'd JSON: the whole bank when recording starts
+    # (or the bank is replaced/resized), otherwise only what changed since.
+    def __init__(self):
+        self.buf = bytearray(SESSION_MAGIC)
+        self.t0 = time.perf_counter()
+        self.last_us = 0
+    def _stamp(self, kind, now):
+        t_us = int((now - self.t0) * 1e6)
+        self.buf.append(kind)
+        self.buf += _varint(max(0, t_us - self.last_us))
+        self.last_us = max(self.last_us, t_us)
+    def midi(self, msg, now=None):
+        data = msg.bin()
+        self._stamp(SESSION_MIDI | (len(data) << 4), now or time.perf_counter())
+        self.buf += data
+    def model(self, state_json, now=None):
+        data = zlib.compress(state_json.encode())
+        self._stamp(SESSION_MODEL, now or time.perf_counter())
+        self.buf += _varint(len(data))
+        self.buf += data
+    def save(self, fname):
+        with open(fname, "wb") as f:
+            f.write(self.buf)
+
+def read_session(data):
+    if not data.startswith(SESSION_MAGIC):
+        raise ValueError("Not an AcidBox session log")
+    pos = len(SESSION_MAGIC)
+    t_us = 0
+    while pos < len(data):
+        kind = data[pos]
+        try:
+            dt, pos = _read_varint(data, pos + 1)
+            if kind & 0x0f != SESSION_MIDI:
+                n, pos = _read_varint(data, pos)
+        except IndexError:
+            raise ValueError("Session log is truncated")
+        t_us += dt
+        if kind & 0x0f == SESSION_MIDI:
+            n = kind >> 4
+        if pos + n > len(data):
+            raise ValueError("Session log is truncated")
+        yield t_us, kind & 0x0f, data[pos:pos+n]
+        pos += n
+
+def render_session_midi(data, fname):
+    mid = mido.MidiFile()
+    track = mido.MidiTrack()
+    mid.tracks.append(track)
+    tempo = 500000
+    track.append(mido.MetaMessage('set_tempo', tempo=tempo, time=0))
+    us_per_tick = tempo / mid.ticks_per_beat
+    last = 0
+    for t_us, kind, payload in read_session(data):
+        if kind != SESSION_MIDI:
+            continue
+        tick = int(round(t_us / us_per_tick))
+        track.append(mido.Message.from_bytes(payload, time=tick - last))
+        last = tick
+    mid.save(fname)
+
+class SessionPlayer(QObject):
+    model_loaded = pyqtSignal(object)
+    finished = pyqtSignal(str)
+    def __init__(self, data, port):
+        super().__init__()
+        self.data = data
+        self.port = port
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+    def start(self):
+        self.thread.start()
+    def stop(self):
+        self.stop_event.set()
+    def run(self):
+        # finished always fires, carrying the error text if the log was damaged
+        error = ""
+        try:
+            t0 = time.perf_counter()
+            for t_us, kind, payload in read_session(self.data):
+                wait = t0 + t_us / 1e6 - time.perf_counter()
+                if wait > 0 and self.stop_event.wait(wait):
+                    break
+                if self.stop_event.is_set():
+                    break
+                if kind == SESSION_MIDI:
+                    self.port.send(mido.Message.from_bytes(payload))
+                else:
+                    self.model_loaded.emit(json.loads(zlib.decompress(payload)))
+        except SESSION_ERRORS as e:
+            error = str(e) or type(e).__name__
+        finally:
+            self.finished.emit(error)
 
 class AcidGridWidget(QWidget):
     def __init__(self, pattern, parent=None):
@@ -133,6 +945,7 @@ class AcidGridWidget(QWidget):
         self.drag_start = None
         self.copied_step = None
         self.parent_gui = None
+        self.edit_lane = None
 
     def get_scale_notes(self):
         intervals = SCALES.get(self.pattern.scale, SCALES["acid"])
@@ -143,6 +956,7 @@ class AcidGridWidget(QWidget):
             notes.append(ROOT_NOTES[absnote])
         return notes
 
+    @profiled("grid.paint")
     def paintEvent(self, event):
         qp = QPainter(self)
         width = self.width()
@@ -207,11 +1021,54 @@ class AcidGridWidget(QWidget):
                 if step.note_idx == note_idx:
                     qp.setPen(QColor(100,100,100))
                     qp.drawText(int(rect_x+6), int(rect_y+14), str(velocity))
+
+        # Automatizační lane přes grid
+        lane = self.pattern.lane(self.edit_lane) if self.edit_lane is not None else None
+        if lane is not None:
+            res = 8
+            curve = lane.render(res)
+            qp.setPen(QColor(255, 140, 0))
+            for t in range(len(curve) - 1):
+                x1 = grid_left + t * step_w / res
+                x2 = grid_left + (t + 1) * step_w / res
+                y1 = grid_top + (1 - curve[t] / 127) * grid_height
+                y2 = grid_top + (1 - curve[t+1] / 127) * grid_height
+                qp.drawLine(int(x1), int(y1), int(x2), int(y2))
+            for i, v in enumerate(lane.values):
+                if v is not None:
+                    x = int(grid_left + i * step_w)
+                    y = int(grid_top + (1 - v / 127) * grid_height)
+                    qp.fillRect(x, y - 2, int(step_w) - 2, 4, QColor(255, 180, 60))
         qp.end()
 
+    def lane_edit(self, event, press):
+        grid_left = 36
+        grid_top = 24
+        grid_width = self.width() - grid_left - 8
+        grid_height = self.height() - grid_top - 10
+        step_w = grid_width / PATTERN_LEN
+        col = int((event.x() - grid_left) // step_w)
+        if not 0 <= col < PATTERN_LEN:
+            return
+        value = max(0, min(127, int(round((1 - (event.y() - grid_top) / grid_height) * 127))))
+        if press and self.parent_gui: self.parent_gui.save_undo()
+        lane = self.pattern.lane(self.edit_lane, create=True)
+        if event.buttons() & Qt.RightButton:
+            lane.set(col, None)
+        else:
+            lane.set(col, value)
+        if not press and self.parent_gui: self.parent_gui.model_changed()
+        self.selected_step = col
+        self.update()
+
     # ... ostatní metody AcidGridWidget jsou beze změny (viz předchozí verze)
 
+    @profiled("grid.press")
     def mousePressEvent(self, event):
+        if self.edit_lane is not None:
+            self.dragging = True
+            self.lane_edit(event, True)
+            return
         width = self.width()
         height = self.height()
         grid_left = 36
@@ -244,7 +1101,11 @@ class AcidGridWidget(QWidget):
                 step.slide = not step.slide
             self.update()
 
+    @profiled("grid.move")
     def mouseMoveEvent(self, event):
+        if self.edit_lane is not None:
+            if self.dragging: self.lane_edit(event, False)
+            return
         width = self.width()
         height = self.height()
         grid_left = 36
@@ -274,7 +1135,10 @@ class AcidGridWidget(QWidget):
         self.dragging = False
         self.drag_start = None
 
+    @profiled("grid.dblclick")
     def mouseDoubleClickEvent(self, event):
+        if self.edit_lane is not None:
+            return
         width = self.width()
         height = self.height()
         grid_left = 36
@@ -299,7 +1163,10 @@ class AcidGridWidget(QWidget):
             self.selected_step = col
             self.update()
 
+    @profiled("grid.wheel")
     def wheelEvent(self, event):
+        if self.edit_lane is not None:
+            return
         width = self.width()
         height = self.height()
         grid_left = 36
@@ -326,6 +1193,7 @@ class AcidGridWidget(QWidget):
                 step.velocity = v
                 self.update()
 
+    @profiled("grid.key")
     def keyPressEvent(self, event):
         if event.key() == Qt.Key_C and (event.modifiers() & Qt.ControlModifier) and self.selected_step is not None:
             s = self.pattern.steps[self.selected_step]
@@ -362,10 +1230,32 @@ class AcidBoxGUI(QWidget):
         self.setWindowTitle("AcidBox - Acid Grid Sequencer")
         self.patterns = [Pattern(name="Pattern 1")]
         self.chain = [0]
+        self.arrangement = Arrangement(self.chain)
         self.active_idx = 0
         self.is_playing = False
         self.outport = None
         self.midi_chan = 0
+        self.voices = VoiceTracker()
+        self.extra_routes = []
+        self.port_errors = {}
+        self.preferred_port = None
+        self.preferred_input = None
+        self.midi_in = None
+        self.midi_in_name = None
+        self.input_mode = "Off"
+        self.input_held = {}
+        self.input_cursor = 0
+        self.input_latency = deque(maxlen=256)
+        self.step_clock = None
+        self.recorder = None
+        self.replay_undo_saved = False
+        self.state_json = None
+        self.snapshot_time = None
+        self.dirty_patterns = set()
+        self.recorded_state = None
+        self.session_player = None
+        self.cc_thinner = CCThinner()
+        self.cc_resolution = 2
         self.tempo = 120
         self.random_wide = len(SCALES["acid"])
         self.random_vel_min = 100
@@ -384,6 +1274,12 @@ class AcidBoxGUI(QWidget):
         self.setMaximumHeight(420)
         self.build_ui()
         self.update_ui()
+        self.port_scanner = PortScanner()
+        self.port_scanner.ports_changed.connect(self.update_ports)
+        self.scan_timer = QTimer()
+        self.scan_timer.timeout.connect(self.port_scanner.scan)
+        self.scan_timer.start(2000)
+        QTimer.singleShot(0, self.port_scanner.scan)
 
     def build_ui(self):
         layout = QHBoxLayout()
@@ -403,6 +1299,7 @@ class AcidBoxGUI(QWidget):
         left.addLayout(ph)
         left.addWidget(QLabel("Chain:"))
         self.chain_list = QListWidget()
+        self.chain_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.refresh_chain_list()
         left.addWidget(self.chain_list, 1)
         ch = QHBoxLayout()
@@ -412,7 +1309,38 @@ class AcidBoxGUI(QWidget):
         btn_chain_del = QPushButton("-")
         btn_chain_del.clicked.connect(self.chain_del)
         ch.addWidget(btn_chain_del)
+        btn_chain_group = QPushButton("[ ]")
+        btn_chain_group.setToolTip("Group selected entries into a section / ungroup a section")
+        btn_chain_group.clicked.connect(self.chain_group)
+        ch.addWidget(btn_chain_group)
+        self.repeat_spin = QSpinBox()
+        self.repeat_spin.setRange(1, 999)
+        self.repeat_spin.setPrefix("×")
+        self.repeat_spin.setToolTip("Repeat count of selected chain entry")
+        self.repeat_spin.valueChanged.connect(self.chain_set_repeat)
+        ch.addWidget(self.repeat_spin)
+        self.chain_list.currentRowChanged.connect(self.chain_row_changed)
+        self.chain_list.itemDoubleClicked.connect(self.chain_seek)
         left.addLayout(ch)
+        hbar = QHBoxLayout()
+        hbar.addWidget(QLabel("Bar:"))
+        self.start_bar_spin = QSpinBox()
+        self.start_bar_spin.setRange(1, 99999)
+        self.start_bar_spin.setToolTip("Start bar (double-click a chain entry to seek)")
+        self.start_bar_spin.editingFinished.connect(self.seek_start)
+        hbar.addWidget(self.start_bar_spin)
+        hbar.addWidget(QLabel("Step:"))
+        self.start_step_spin = QSpinBox()
+        self.start_step_spin.setRange(1, PATTERN_LEN)
+        self.start_step_spin.setToolTip("Start step within the bar")
+        self.start_step_spin.editingFinished.connect(self.seek_start)
+        hbar.addWidget(self.start_step_spin)
+        self.cb_loop = QCheckBox("Loop to")
+        hbar.addWidget(self.cb_loop)
+        self.loop_end_spin = QSpinBox()
+        self.loop_end_spin.setRange(1, 99999)
+        hbar.addWidget(self.loop_end_spin)
+        left.addLayout(hbar)
         left.setStretchFactor(self.pattern_list, 1)
         left.setStretchFactor(self.chain_list, 1)
         layout.addLayout(left)
@@ -431,16 +1359,89 @@ class AcidBoxGUI(QWidget):
         btn_undo.setToolTip("Undo (Ctrl+Z)")
         btn_undo.clicked.connect(self.undo)
         h_shift.addWidget(btn_undo)
+        self.cb_profile = QCheckBox("Profile")
+        self.cb_profile.setToolTip("Time event handlers, paint, undo and list refresh (p50/p99)")
+        self.cb_profile.stateChanged.connect(self.set_profiling)
+        h_shift.addWidget(self.cb_profile)
+        btn_trace = QPushButton("Trace")
+        btn_trace.setToolTip("Save profiler trace (chrome://tracing / Perfetto)")
+        btn_trace.clicked.connect(self.save_trace)
+        h_shift.addWidget(btn_trace)
+        self.profile_label = QLabel("")
+        self.profile_label.setFont(QFont("Monospace", 8))
+        h_shift.addWidget(self.profile_label, 1)
         h_shift.addStretch()
         grid_and_buttons.addLayout(h_shift)
+        hauto = QHBoxLayout()
+        hauto.addWidget(QLabel("Edit:"))
+        self.lane_combo = QComboBox()
+        self.lane_combo.addItems(["Notes"] + list(AUTOMATION_CCS))
+        self.lane_combo.currentTextChanged.connect(self.set_edit_lane)
+        hauto.addWidget(self.lane_combo)
+        hauto.addWidget(QLabel("Curve:"))
+        self.curve_combo = QComboBox()
+        self.curve_combo.addItems(LANE_CURVES)
+        self.curve_combo.currentTextChanged.connect(self.set_lane_curve)
+        hauto.addWidget(self.curve_combo)
+        hauto.addWidget(QLabel("CC res:"))
+        self.cc_res_spin = QSpinBox()
+        self.cc_res_spin.setRange(1, 8)
+        self.cc_res_spin.setValue(self.cc_resolution)
+        self.cc_res_spin.setToolTip("CC messages per step")
+        self.cc_res_spin.valueChanged.connect(lambda v: setattr(self, "cc_resolution", v))
+        hauto.addWidget(self.cc_res_spin)
+        hauto.addWidget(QLabel("Thin:"))
+        self.cc_thin_spin = QSpinBox()
+        self.cc_thin_spin.setRange(1, 16)
+        self.cc_thin_spin.setValue(self.cc_thinner.min_delta)
+        self.cc_thin_spin.setToolTip("Minimum CC change worth sending")
+        self.cc_thin_spin.valueChanged.connect(lambda v: setattr(self.cc_thinner, "min_delta", v))
+        hauto.addWidget(self.cc_thin_spin)
+        hauto.addStretch()
+        grid_and_buttons.addLayout(hauto)
         layout.addLayout(grid_and_buttons)
         right = QVBoxLayout()
         h1 = QHBoxLayout()
         h1.addWidget(QLabel("MIDI Port:"))
         self.midi_combo = QComboBox()
-        self.midi_combo.addItems(mido.get_output_names())
+        self.midi_combo.activated.connect(lambda i: setattr(self, "preferred_port", self.midi_combo.itemText(i)))
         h1.addWidget(self.midi_combo)
         right.addLayout(h1)
+        hr = QHBoxLayout()
+        btn_route_add = QPushButton("+")
+        btn_route_add.setToolTip("Also send to the selected port / channel")
+        btn_route_add.clicked.connect(self.route_add)
+        hr.addWidget(btn_route_add)
+        btn_route_clear = QPushButton("×")
+        btn_route_clear.setToolTip("Clear extra outputs")
+        btn_route_clear.clicked.connect(self.route_clear)
+        hr.addWidget(btn_route_clear)
+        self.routes_label = QLabel("")
+        hr.addWidget(self.routes_label)
+        self.port_status_label = QLabel("")
+        self.port_status_label.setStyleSheet("color: #e05050")
+        hr.addWidget(self.port_status_label, 1)
+        hr.addWidget(QLabel("Queue:"))
+        self.policy_combo = QComboBox()
+        self.policy_combo.addItems(QUEUE_POLICIES)
+        self.policy_combo.setToolTip("What to do when a port's send queue is full")
+        hr.addWidget(self.policy_combo)
+        right.addLayout(hr)
+        hin = QHBoxLayout()
+        hin.addWidget(QLabel("MIDI In:"))
+        self.in_combo = QComboBox()
+        self.in_combo.activated.connect(self.select_input)
+        hin.addWidget(self.in_combo)
+        hin.addWidget(QLabel("Rec:"))
+        self.input_mode_combo = QComboBox()
+        self.input_mode_combo.addItems(INPUT_MODES)
+        self.input_mode_combo.setToolTip("Step: each note fills the next step from the selected one\n"
+                                         "Realtime: notes are quantized to the playing step")
+        self.input_mode_combo.currentTextChanged.connect(self.set_input_mode)
+        hin.addWidget(self.input_mode_combo)
+        self.input_latency_label = QLabel("")
+        hin.addWidget(self.input_latency_label)
+        right.addLayout(hin)
         h2 = QHBoxLayout()
         h2.addWidget(QLabel("Ch:"))
         self.channel_spin = QSpinBox()
@@ -451,6 +1452,7 @@ class AcidBoxGUI(QWidget):
         self.tempo_spin = QSpinBox()
         self.tempo_spin.setRange(60, 200)
         self.tempo_spin.setValue(125)
+        self.tempo_spin.valueChanged.connect(self.model_changed)
         h2.addWidget(self.tempo_spin)
         right.addLayout(h2)
         h3 = QHBoxLayout()
@@ -553,6 +1555,10 @@ class AcidBoxGUI(QWidget):
         self.btn_random = QPushButton("Randomize")
         self.btn_random.clicked.connect(self.randomize_pattern)
         hc.addWidget(self.btn_random)
+        self.btn_mutate = QPushButton("Mutate")
+        self.btn_mutate.setToolTip("Add a mutated variation of the current pattern")
+        self.btn_mutate.clicked.connect(self.mutate_pattern)
+        hc.addWidget(self.btn_mutate)
         self.btn_play = QPushButton("Play")
         self.btn_play.clicked.connect(self.toggle_play)
         hc.addWidget(self.btn_play)
@@ -568,11 +1574,39 @@ class AcidBoxGUI(QWidget):
         self.btn_load.clicked.connect(self.load_pattern)
         he.addWidget(self.btn_load)
         right.addLayout(he)
+        hs = QHBoxLayout()
+        self.cb_record = QCheckBox("Rec session")
+        self.cb_record.setToolTip("Record model changes and sent MIDI into a session log")
+        self.cb_record.stateChanged.connect(self.set_recording)
+        hs.addWidget(self.cb_record)
+        self.btn_replay = QPushButton("Replay")
+        self.btn_replay.setToolTip("Replay a session log to the selected MIDI port")
+        self.btn_replay.clicked.connect(self.replay_session)
+        hs.addWidget(self.btn_replay)
+        btn_render = QPushButton("Render")
+        btn_render.setToolTip("Render a session log to a MIDI file")
+        btn_render.clicked.connect(self.render_session)
+        hs.addWidget(btn_render)
+        right.addLayout(hs)
         layout.addLayout(right)
         self.setLayout(layout)
         self.timer = QTimer()
         self.timer.timeout.connect(self.play_step)
-        self.play_pat_idx = 0
+        self.voice_timer = QTimer()
+        self.voice_timer.setSingleShot(True)
+        self.voice_timer.timeout.connect(self.release_due_notes)
+        self.cc_timer = QTimer()
+        self.cc_timer.setSingleShot(True)
+        self.cc_timer.timeout.connect(self.send_automation_tick)
+        self.cc_tick = None
+        self.cc_sub = 0
+        self.profile_timer = QTimer()
+        self.profile_timer.timeout.connect(self.update_profile_label)
+        # per-port latency/drop stats are cheap to read, so they refresh regardless of profiling
+        self.port_stats_timer = QTimer()
+        self.port_stats_timer.timeout.connect(self.refresh_routes_label)
+        self.port_stats_timer.start(1000)
+        self.play_bar = 0
         self.play_step_idx = 0
 
     # ... Všechny metody GUI jsou beze změn (viz minulé verze)
@@ -592,31 +1626,357 @@ class AcidBoxGUI(QWidget):
         self.swing_label.setText(f"{v}%")
     def set_density(self, v): self.density = v
 
+    def set_edit_lane(self, name):
+        self.grid.edit_lane = AUTOMATION_CCS.get(name)
+        self.sync_lane_controls()
+        self.grid.update()
+
+    def set_lane_curve(self, curve):
+        if self.grid.edit_lane is None: return
+        lane = self.patterns[self.active_idx].lane(self.grid.edit_lane, create=True)
+        if lane.curve != curve:
+            self.save_undo()
+            lane.set_curve(curve)
+            self.grid.update()
+
+    def sync_lane_controls(self):
+        cc = self.grid.edit_lane
+        lane = self.patterns[self.active_idx].lane(cc) if cc is not None else None
+        self.curve_combo.setEnabled(cc is not None)
+        self.curve_combo.blockSignals(True)
+        self.curve_combo.setCurrentText(lane.curve if lane else LANE_CURVES[0])
+        self.curve_combo.blockSignals(False)
+
+    def set_profiling(self, state):
+        PROFILER.enabled = bool(state)
+        if PROFILER.enabled:
+            PROFILER.reset()
+            self.profile_timer.start(500)
+        else:
+            self.profile_timer.stop()
+            self.profile_label.setText("")
+
+    def update_profile_label(self):
+        self.profile_label.setText(PROFILER.summary())
+        self.profile_label.setToolTip("\n".join(
+            f"{name}: n={n} p50={p50:.3f}ms p99={p99:.3f}ms" for name, n, p50, p99 in PROFILER.stats()))
+
+    def sync_port_combo(self, combo, names, preferred):
+        current = preferred or combo.currentText()
+        for i in reversed(range(combo.count())):
+            if combo.itemText(i) not in names:
+                combo.removeItem(i)
+        existing = [combo.itemText(i) for i in range(combo.count())]
+        for i, name in enumerate(names):
+            if name not in existing:
+                combo.insertItem(i, name)
+        # a replugged device may come back under new ALSA numbers
+        for name in names:
+            if current and port_key(name) == port_key(current):
+                combo.setCurrentText(name)
+                break
+
+    def update_ports(self, outputs, inputs):
+        self.sync_port_combo(self.midi_combo, outputs, self.preferred_port)
+        self.sync_port_combo(self.in_combo, inputs, self.preferred_input)
+        if isinstance(self.outport, MidiFanout):
+            self.outport.refresh(outputs)
+        if self.midi_in:
+            # like MidiFanout.refresh: a replug under new ALSA numbers leaves the
+            # old MidiInput dead, so reopen it under the current name
+            same = [n for n in inputs if port_key(n) == port_key(self.midi_in_name)]
+            if not same:
+                self.close_input()
+            elif same[0] != self.midi_in_name:
+                self.close_input()
+                self.open_input(same[0])
+        elif self.input_mode != "Off" and not self.midi_in and self.in_combo.currentText():
+            self.open_input()
+
+    def select_input(self, i):
+        self.preferred_input = self.in_combo.itemText(i)
+        if self.midi_in:
+            self.close_input()
+            self.open_input()
+
+    def open_input(self, name=None):
+        name = name or self.in_combo.currentText()
+        if not name: return
+        try:
+            self.midi_in = MidiInput(name)
+        except (IOError, OSError) as e:
+            # reported like output errors: this also runs from the background rescan
+            self.show_port_status("MIDI In", f"{name}: {e}")
+            return
+        self.show_port_status("MIDI In", "")
+        self.midi_in_name = name
+        self.midi_in.note.connect(self.input_note)
+
+    def close_input(self):
+        if self.midi_in:
+            self.midi_in.close()
+            self.midi_in = None
+        self.input_held = {}
+        self.show_port_status("MIDI In", "")
+
+    def set_input_mode(self, mode):
+        self.input_mode = mode
+        self.close_input()
+        if mode == "Off": return
+        self.save_undo()
+        self.input_cursor = self.grid.selected_step or 0
+        self.open_input()
+
+    def input_target(self, t_in):
+        if self.input_mode == "Step":
+            pat = self.patterns[self.active_idx]
+            idx = self.input_cursor
+            self.input_cursor = (idx + 1) % PATTERN_LEN
+            return pat, idx
+        if self.input_mode == "Realtime" and self.is_playing and self.step_clock and self.arrangement.bars:
+            start, bar, step_idx, step_time = self.step_clock
+            idx = step_idx + int(round((t_in - start) * 1000 / step_time))
+            # walk bars the way playback does, so quantizing past a loop end lands on the loop start
+            while idx >= PATTERN_LEN:
+                idx -= PATTERN_LEN
+                bar = self.next_bar(bar)
+            while idx < 0:
+                idx += PATTERN_LEN
+                bar = self.prev_bar(bar)
+            pat_idx = self.arrangement.pattern_at(bar)
+            if pat_idx < len(self.patterns):
+                return self.patterns[pat_idx], idx
+        return None, None
+
+    def input_note(self, t_in, msg):
+        if msg.type == 'note_off' or msg.velocity == 0:
+            self.input_held.pop(msg.note, None)
+            return
+        pat, idx = self.input_target(t_in)
+        if pat is None: return
+        step = pat.steps[idx]
+        step.note_idx = pat.note_idx_for(msg.note)
+        step.velocity = msg.velocity
+        step.accent = msg.velocity >= ACCENT_VELOCITY
+        step.slide = False
+        # legato playing: a note still held when the next one starts slides into it
+        for held_pat, held_idx in self.input_held.values():
+            if held_pat is pat and held_idx != idx:
+                held_pat.steps[held_idx].slide = True
+        self.input_held[msg.note] = (pat, idx)
+        self.model_changed(pattern_idx=self.patterns.index(pat))
+        if pat is self.grid.pattern:
+            self.grid.selected_step = idx
+            self.grid.update()
+        now = time.perf_counter()
+        self.input_latency.append((now - t_in) * 1000.0)
+        if PROFILER.enabled:
+            PROFILER.record("midi_in.to_grid", t_in, now)
+        self.input_latency_label.setText(f"{percentile(list(self.input_latency), 0.99):.1f}ms")
+        self.input_latency_label.setToolTip(
+            f"Input to grid latency p50={percentile(list(self.input_latency), 0.5):.2f}ms "
+            f"p99={percentile(list(self.input_latency), 0.99):.2f}ms")
+
+    def open_outputs(self, routes):
+        self.port_errors = {n: e for n, e in self.port_errors.items() if n == "MIDI In"}
+        self.show_port_status("MIDI In", self.port_errors.get("MIDI In", ""))
+        fanout = MidiFanout(routes, self.policy_combo.currentText())
+        fanout.port_status.connect(self.show_port_status)
+        fanout.start()
+        return fanout
+
+    def show_port_status(self, name, error):
+        if error:
+            self.port_errors[name] = error
+        else:
+            self.port_errors.pop(name, None)
+        self.port_status_label.setText("⚠ " + ", ".join(self.port_errors) if self.port_errors else "")
+        self.port_status_label.setToolTip("\n".join(f"{n}: {e}" for n, e in self.port_errors.items()))
+        self.refresh_routes_label()
+
+    def output_routes(self):
+        return [(self.midi_combo.currentText(), [self.channel_spin.value() - 1])] + self.extra_routes
+
+    def route_add(self):
+        route = (self.midi_combo.currentText(), [self.channel_spin.value() - 1])
+        if not route[0] or route in self.extra_routes: return
+        self.extra_routes.append(route)
+        self.refresh_routes_label()
+
+    def route_clear(self):
+        self.extra_routes = []
+        self.refresh_routes_label()
+
+    def refresh_routes_label(self):
+        text = f"+{len(self.extra_routes)} out" if self.extra_routes else ""
+        lines = [f"{name} ch {chans[0]+1}" for name, chans in self.extra_routes]
+        if isinstance(self.outport, MidiFanout):
+            stats = self.outport.stats()
+            dropped = sum(s[3] for s in stats)
+            if dropped:
+                text = f"{text} {dropped} dropped".strip()
+            lines += [f"{name}: p50={p50:.2f}ms p99={p99:.2f}ms dropped={dropped}" + (f" ({error})" if error else "")
+                      for name, p50, p99, dropped, error in stats]
+        self.routes_label.setText(text)
+        self.routes_label.setToolTip("\n".join(lines))
+
+    def save_trace(self):
+        fname, _ = QFileDialog.getSaveFileName(self, "Save Profiler Trace", "", "Trace JSON (*.json)")
+        if not fname: return
+        PROFILER.dump_trace(fname)
+
+    @profiled("undo.snapshot")
     def save_undo(self):
         if len(self.undo_stack) >= self.max_undo:
             self.undo_stack.pop(0)
-        snapshot = json.dumps({
+        self.undo_stack.append(self.model_json())
+        # the edit follows this call
+        self.model_changed()
+
+    def model_state(self):
+        return {
             "patterns": [p.as_dict() for p in self.patterns],
             "chain": list(self.chain),
-            "active_idx": self.active_idx
-        })
-        self.undo_stack.append(snapshot)
+            "active_idx": self.active_idx,
+            "tempo": self.tempo_spin.value()
+        }
+
+    def model_json(self):
+        # cached until the next model_changed(); shared by undo and the session recorder
+        if self.state_json is None:
+            self.state_json = json.dumps(self.model_state())
+        return self.state_json
+
+    def restore_state(self, data):
+        self.patterns = [Pattern.from_dict(p) for p in data["patterns"]]
+        self.chain = data.get("chain", [0])
+        self.active_idx = data.get("active_idx", 0)
+        self.pattern_list.clear()
+        for p in self.patterns:
+            self.pattern_list.addItem(p.name)
+        self.refresh_chain_list()
+        self.pattern_list.setCurrentRow(self.active_idx)
+        self.grid.pattern = self.patterns[self.active_idx]
+        self.grid.update()
+        self.update_ui()
+        self.model_changed()
 
     def undo(self):
         if self.undo_stack:
             snapshot = self.undo_stack.pop()
-            data = json.loads(snapshot)
-            self.patterns = [Pattern.from_dict(p) for p in data["patterns"]]
-            self.chain = data.get("chain", [0])
-            self.active_idx = data.get("active_idx", 0)
-            self.pattern_list.clear()
-            for p in self.patterns:
-                self.pattern_list.addItem(p.name)
+            self.restore_state(json.loads(snapshot))
+
+    def model_changed(self, *args, pattern_idx=None):
+        self.state_json = None
+        if not self.recorder: return
+        self.dirty_patterns.add(self.active_idx if pattern_idx is None else pattern_idx)
+        # coalesce a burst of edits into one snapshot, taken outside the clock callback
+        if self.snapshot_time is None:
+            self.snapshot_time = time.perf_counter()
+            QTimer.singleShot(0, self.record_snapshot)
+
+    def record_snapshot(self):
+        edit_time, self.snapshot_time = self.snapshot_time, None
+        dirty, self.dirty_patterns = self.dirty_patterns, set()
+        if not self.recorder or edit_time is None: return
+        state = {"chain": list(self.chain), "active_idx": self.active_idx, "tempo": self.tempo_spin.value()}
+        last = self.recorded_state
+        if last is None or last["bank"] is not self.patterns or last["count"] != len(self.patterns):
+            self.recorder.model(self.model_json(), edit_time)
+        else:
+            # in-place edits: only the touched patterns and the changed settings
+            delta = {k: v for k, v in state.items() if last[k] != v}
+            edits = {str(i): self.patterns[i].as_dict() for i in sorted(dirty) if i < len(self.patterns)}
+            if edits:
+                delta["pattern_edits"] = edits
+            if delta:
+                self.recorder.model(json.dumps(delta), edit_time)
+        self.recorded_state = dict(state, bank=self.patterns, count=len(self.patterns))
+
+    def set_recording(self, state):
+        if state:
+            self.recorder = SessionRecorder()
+            self.recorded_state = None
+            self.model_changed()
+            return
+        self.record_snapshot()
+        recorder, self.recorder = self.recorder, None
+        if recorder is None: return
+        fname, _ = QFileDialog.getSaveFileName(self, "Save Session", "", "AcidBox session (*.acbs)")
+        if fname:
+            recorder.save(fname)
+
+    def replay_session(self):
+        if self.session_player:
+            self.session_player.stop()
+            return
+        fname, _ = QFileDialog.getOpenFileName(self, "Replay Session", "", "AcidBox session (*.acbs)")
+        if not fname: return
+        with open(fname, "rb") as f:
+            data = f.read()
+        if not data.startswith(SESSION_MAGIC):
+            QMessageBox.warning(self, "Replay Session", "Not an AcidBox session log.")
+            return
+        if self.is_playing:
+            self.toggle_play()
+        # replay sends the recorded bytes as they are, only the destination ports come from the UI
+        port = self.open_outputs([(name, None) for name, _ in self.output_routes()])
+        self.session_player = SessionPlayer(data, port)
+        self.replay_undo_saved = False
+        self.session_player.model_loaded.connect(self.apply_session_state)
+        self.session_player.finished.connect(self.replay_finished)
+        self.btn_replay.setText("Stop replay")
+        self.session_player.start()
+
+    def apply_session_state(self, data):
+        # one undo point per replay keeps the pre-replay bank recoverable with Undo
+        if not self.replay_undo_saved:
+            self.save_undo()
+            self.replay_undo_saved = True
+        if "patterns" in data:
+            self.restore_state(data)
+        else:
+            self.apply_session_delta(data)
+        if "tempo" in data:
+            self.tempo_spin.setValue(data["tempo"])
+
+    def apply_session_delta(self, data):
+        for i, d in data.get("pattern_edits", {}).items():
+            i = int(i)
+            if i >= len(self.patterns): continue
+            self.patterns[i] = Pattern.from_dict(d)
+            self.pattern_list.item(i).setText(self.patterns[i].name)
+        if "chain" in data:
+            self.chain = data["chain"]
             self.refresh_chain_list()
+        if "active_idx" in data and data["active_idx"] < len(self.patterns):
+            self.active_idx = data["active_idx"]
             self.pattern_list.setCurrentRow(self.active_idx)
-            self.grid.pattern = self.patterns[self.active_idx]
-            self.grid.update()
-            self.update_ui()
+        self.grid.pattern = self.patterns[self.active_idx]
+        self.grid.update()
+        self.update_ui()
+        self.model_changed()
+
+    def replay_finished(self, error):
+        player, self.session_player = self.session_player, None
+        if player:
+            player.thread.join()
+            player.port.close()
+        self.btn_replay.setText("Replay")
+        if error:
+            QMessageBox.warning(self, "Replay Session", f"Replay stopped: {error}")
+
+    def render_session(self):
+        fname, _ = QFileDialog.getOpenFileName(self, "Render Session", "", "AcidBox session (*.acbs)")
+        if not fname: return
+        out, _ = QFileDialog.getSaveFileName(self, "Export MIDI", "", "MIDI files (*.mid)")
+        if not out: return
+        with open(fname, "rb") as f:
+            data = f.read()
+        try:
+            render_session_midi(data, out)
+        except SESSION_ERRORS as e:
+            QMessageBox.warning(self, "Render Session", f"Cannot render session: {e}")
 
     def add_pattern(self):
         self.save_undo()
@@ -646,6 +2006,7 @@ class AcidBoxGUI(QWidget):
         self.grid.pattern = self.patterns[self.active_idx]
         self.grid.update()
         self.update_ui()
+        self.model_changed()
 
     def chain_add(self):
         self.save_undo()
@@ -660,27 +2021,107 @@ class AcidBoxGUI(QWidget):
             self.chain.pop(row)
             self.refresh_chain_list()
 
+    def chain_row_changed(self, row):
+        if 0 <= row < len(self.chain):
+            self.repeat_spin.blockSignals(True)
+            self.repeat_spin.setValue(chain_entry_repeat(self.chain[row]))
+            self.repeat_spin.blockSignals(False)
+
+    def chain_set_repeat(self, n):
+        row = self.chain_list.currentRow()
+        if row < 0 or row >= len(self.chain): return
+        entry = self.chain[row]
+        if chain_entry_repeat(entry) == n: return
+        self.save_undo()
+        if isinstance(entry, dict):
+            entry = dict(entry, repeat=n)
+            if 'items' not in entry and n == 1:
+                entry = entry.get('pattern', 0)
+        else:
+            entry = {'pattern': entry, 'repeat': n}
+        self.chain[row] = entry
+        self.refresh_chain_list()
+        self.chain_list.setCurrentRow(row)
+
+    def chain_group(self):
+        rows = sorted(self.chain_list.row(item) for item in self.chain_list.selectedItems())
+        if not rows: return
+        self.save_undo()
+        first, last = rows[0], rows[-1]
+        entry = self.chain[first]
+        if first == last and isinstance(entry, dict) and 'items' in entry:
+            self.chain[first:first+1] = list(entry['items']) * chain_entry_repeat(entry)
+        else:
+            nsections = sum(1 for e in self.chain if isinstance(e, dict) and 'items' in e)
+            section = {'name': f"Section {nsections+1}", 'items': self.chain[first:last+1], 'repeat': 1}
+            self.chain[first:last+1] = [section]
+        self.refresh_chain_list()
+        self.chain_list.setCurrentRow(first)
+
+    def chain_seek(self, item):
+        row = self.chain_list.row(item)
+        if row < 0 or row >= len(self.arrangement.entry_start): return
+        self.start_bar_spin.setValue(self.arrangement.entry_start[row] + 1)
+        self.start_step_spin.setValue(1)
+        self.seek_start()
+
+    def start_position(self):
+        step = (self.start_bar_spin.value() - 1) * PATTERN_LEN + self.start_step_spin.value() - 1
+        bar, step_idx, _ = self.arrangement.locate(step)
+        return bar, step_idx
+
+    def seek_start(self):
+        if self.is_playing and self.arrangement.bars:
+            self.play_bar, self.play_step_idx = self.start_position()
+
+    def loop_region(self):
+        bars = self.arrangement.bars
+        start = min(self.start_bar_spin.value() - 1, bars - 1)
+        end = min(self.loop_end_spin.value() - 1, bars - 1)
+        return start, max(start, end)
+
+    def next_bar(self, bar):
+        bar += 1
+        if self.cb_loop.isChecked():
+            start, end = self.loop_region()
+            if bar > end or bar < start:
+                return start
+        if bar >= self.arrangement.bars:
+            return 0
+        return bar
+
+    def prev_bar(self, bar):
+        if self.cb_loop.isChecked():
+            start, end = self.loop_region()
+            if bar <= start or bar > end:
+                return end
+        if bar <= 0:
+            return self.arrangement.bars - 1
+        return bar - 1
+
+    @profiled("chain.refresh")
     def refresh_chain_list(self):
+        self.arrangement = Arrangement(self.chain)
         self.chain_list.clear()
-        for idx in self.chain:
-            if idx < len(self.patterns):
-                self.chain_list.addItem(self.patterns[idx].name)
-            else:
-                self.chain_list.addItem("X")
+        for entry in self.chain:
+            self.chain_list.addItem(chain_entry_label(entry, self.patterns))
 
     def change_scale(self, scale):
         self.patterns[self.active_idx].scale = scale
         self.patterns[self.active_idx].fix_note_indices()
         nnotes = len(SCALES[scale])
         self.wide_spin.setMaximum(nnotes)
+        self.model_changed()
         self.grid.update()
 
     def change_root(self, note):
         self.patterns[self.active_idx].root = note
+        self.model_changed()
         self.grid.update()
 
     def change_octave(self, octv):
         self.patterns[self.active_idx].octave = octv
+        self.model_changed()
 
     def transpose(self, amount):
         self.save_undo()
@@ -698,6 +2139,7 @@ class AcidBoxGUI(QWidget):
         self.swing_label.setText(f"{pat.swing}%")
         self.density_spin.setValue(self.density)
         self.wide_spin.setMaximum(len(SCALES[pat.scale]))
+        self.sync_lane_controls()
         self.refresh_chain_list()
 
     def rotate_left(self):
@@ -749,35 +2191,46 @@ class AcidBoxGUI(QWidget):
         self.density_spin.setValue(self.density)
         self.grid.update()
 
+    def mutate_pattern(self):
+        self.save_undo()
+        pat = self.patterns[self.active_idx]
+        pop = PatternPopulation.from_patterns([pat]).mutate(rate=0.15)
+        p = pop.to_pattern(0, pat, name=f"{pat.name} var")
+        self.patterns.append(p)
+        self.pattern_list.addItem(p.name)
+        self.pattern_list.setCurrentRow(len(self.patterns) - 1)
+
     def toggle_play(self):
         if self.is_playing:
             self.is_playing = False
             self.timer.stop()
+            self.voice_timer.stop()
+            self.cc_timer.stop()
             self.btn_play.setText("Play")
+            self.release_all_notes()
             QTimer.singleShot(15, self.safe_close_port)
             self.grid.set_active_step(-1)
         else:
-            self.outport = mido.open_output(self.midi_combo.currentText())
+            self.outport = self.open_outputs(self.output_routes())
             self.midi_chan = self.channel_spin.value() - 1
             self.tempo = self.tempo_spin.value()
-            self.play_pat_idx = 0
-            self.play_step_idx = 0
+            self.play_bar, self.play_step_idx = self.start_position() if self.arrangement.bars else (0, 0)
+            self.cc_thinner.reset()
             self.btn_play.setText("Stop")
             self.is_playing = True
             self.timer.start(int(60000 / (self.tempo * 4)))
-            for p in self.patterns:
-                for s in p.midi_notes():
-                    if s is not None:
-                        self.outport.send(mido.Message('note_off', note=s, velocity=0, channel=self.midi_chan))
+            for n in sorted({s for p in self.patterns for s in p.midi_notes() if s is not None}):
+                self.send_midi(mido.Message('note_off', note=n, velocity=0, channel=self.midi_chan))
 
     def safe_close_port(self):
         if self.outport:
             self.outport.close()
             self.outport = None
 
+    @profiled("play_step")
     def play_step(self):
-        if not self.is_playing: return
-        pat_idx = self.chain[self.play_pat_idx % len(self.chain)]
+        if not self.is_playing or not self.arrangement.bars: return
+        pat_idx = self.arrangement.pattern_at(self.play_bar)
         if pat_idx >= len(self.patterns): return
         pat = self.patterns[pat_idx]
         step = pat.steps[self.play_step_idx]
@@ -792,26 +2245,88 @@ class AcidBoxGUI(QWidget):
         else:
             swing_ratio = (swing-50)/50.0
             step_time = int(base_time * (1 - 0.5 * swing_ratio))
-        if note is not None:
-            vel = velocity
-            self.outport.send(mido.Message('note_on', note=note, velocity=vel, channel=self.midi_chan))
+        now = time.perf_counter()
+        self.step_clock = (now, self.play_bar, self.play_step_idx, step_time)
+        self.play_note(note, velocity, step.slide, now, step_time)
+        self.start_automation(pat, self.play_step_idx, step_time)
         if pat_idx == self.active_idx:
             self.grid.set_active_step(self.play_step_idx)
         else:
             self.grid.set_active_step(-1)
-        if note is not None and not step.slide:
-            QTimer.singleShot(int(step_time * 0.7), lambda n=note: self.safe_note_off(n))
         self.play_step_idx += 1
         if self.play_step_idx >= PATTERN_LEN:
             self.play_step_idx = 0
-            self.play_pat_idx += 1
-            if self.play_pat_idx >= len(self.chain):
-                self.play_pat_idx = 0
+            self.play_bar = self.next_bar(self.play_bar)
         self.timer.start(step_time)
 
-    def safe_note_off(self, n):
-        if self.is_playing and self.outport:
-            self.outport.send(mido.Message('note_off', note=n, velocity=0, channel=self.midi_chan))
+    def play_note(self, note, velocity, slide, now, step_time):
+        chan = self.midi_chan
+        for channel, n in self.voices.due(now):
+            self.send_midi(mido.Message('note_off', note=n, velocity=0, channel=channel))
+        tied = self.voices.tied(chan)
+        if note is not None:
+            if note not in tied:
+                if note in self.voices.sounding(chan):
+                    self.send_midi(mido.Message('note_off', note=note, velocity=0, channel=chan))
+                self.send_midi(mido.Message('note_on', note=note, velocity=velocity, channel=chan))
+            off_time = None if slide else now + step_time * 0.7 / 1000.0
+            self.voices.start(chan, note, off_time)
+        # legato: the tied note is released only after the next note started
+        for n in tied:
+            if n != note:
+                self.voices.stop(chan, n)
+                self.send_midi(mido.Message('note_off', note=n, velocity=0, channel=chan))
+        self.schedule_note_offs(now)
+
+    def automation_values(self, pat, step_idx, sub, res):
+        t = step_idx * res + sub
+        values = []
+        for lane in pat.lanes:
+            curve = lane.render(res)
+            if curve:
+                values.append((lane.cc, curve[t], sub == 0 and lane.values[step_idx] is not None))
+        return values
+
+    def start_automation(self, pat, step_idx, step_time):
+        self.cc_timer.stop()
+        if not pat.lanes: return
+        self.cc_tick = (pat, step_idx, step_time / self.cc_resolution, self.cc_resolution)
+        self.cc_sub = 0
+        self.send_automation_tick()
+
+    def send_automation_tick(self):
+        if not self.outport or self.cc_tick is None: return
+        pat, step_idx, tick_ms, res = self.cc_tick
+        values = self.automation_values(pat, step_idx, self.cc_sub, res)
+        for cc, v in self.cc_thinner.select(self.midi_chan, values, tick_ms):
+            self.send_midi(mido.Message('control_change', control=cc, value=v, channel=self.midi_chan))
+        self.cc_sub += 1
+        if self.cc_sub < res:
+            self.cc_timer.start(int(tick_ms))
+
+    def schedule_note_offs(self, now):
+        due = self.voices.next_due()
+        if due is None:
+            self.voice_timer.stop()
+        else:
+            self.voice_timer.start(max(0, int((due - now) * 1000) + 1))
+
+    def release_due_notes(self):
+        if not self.outport: return
+        now = time.perf_counter()
+        for channel, n in self.voices.due(now):
+            self.send_midi(mido.Message('note_off', note=n, velocity=0, channel=channel))
+        self.schedule_note_offs(now)
+
+    def send_midi(self, msg):
+        if self.recorder:
+            self.recorder.midi(msg)
+        self.outport.send(msg)
+
+    def release_all_notes(self):
+        for channel, n in self.voices.release_all():
+            if self.outport:
+                self.send_midi(mido.Message('note_off', note=n, velocity=0, channel=channel))
 
     def save_pattern(self):
         fname, _ = QFileDialog.getSaveFileName(self, "Save Patterns", "", "Pattern JSON (*.json)")
@@ -838,6 +2353,7 @@ class AcidBoxGUI(QWidget):
         self.grid.pattern = self.patterns[self.active_idx]
         self.grid.update()
         self.update_ui()
+        self.model_changed()
 
     def export_midi(self):
         fname, _ = QFileDialog.getSaveFileName(self, "Export MIDI", "", "MIDI files (*.mid)")
@@ -846,15 +2362,34 @@ class AcidBoxGUI(QWidget):
         track = mido.MidiTrack()
         mid.tracks.append(track)
         chan = self.channel_spin.value()-1
-        for pat_idx in self.chain:
+        step_ticks = mid.ticks_per_beat // 4
+        res = self.cc_resolution
+        tick_ms = 60000 / (self.tempo_spin.value() * 4) / res
+        thinner = CCThinner(self.cc_thinner.min_delta, self.cc_thinner.share)
+        events = []
+        t0 = 0
+        for pat_idx in self.arrangement.iter_bars():
+            if pat_idx >= len(self.patterns): continue
             pat = self.patterns[pat_idx]
             notes = pat.midi_notes()
             for idx, s in enumerate(pat.steps):
+                t = t0 + idx * step_ticks
                 note = notes[idx]
                 vel = getattr(s, "velocity", 80)
                 if note is not None:
-                    track.append(mido.Message('note_on', note=note, velocity=vel, time=0, channel=chan))
-                    track.append(mido.Message('note_off', note=note, velocity=0, time=120, channel=chan))
+                    events.append((t, 1, mido.Message('note_on', note=note, velocity=vel, channel=chan)))
+                    events.append((t + step_ticks, 0, mido.Message('note_off', note=note, velocity=0, channel=chan)))
+                for sub in range(res if pat.lanes else 0):
+                    values = self.automation_values(pat, idx, sub, res)
+                    for cc, v in thinner.select(chan, values, tick_ms):
+                        events.append((t + sub * step_ticks // res, 2,
+                                       mido.Message('control_change', control=cc, value=v, channel=chan)))
+            t0 += PATTERN_LEN * step_ticks
+        events.sort(key=lambda e: (e[0], e[1]))
+        last = 0
+        for t, _, msg in events:
+            track.append(msg.copy(time=t - last))
+            last = t
         mid.save(fname)
 
 if __name__ == "__main__":